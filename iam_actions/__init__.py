@@ -1,11 +1,19 @@
 # SPDX-License-Identifier: MIT
 # Copyright 2020-2023 Big Bad Wolf Security, LLC
 
-from . import data
+import importlib
 
 __all__ = ["data"]
 __version__ = "0.1.0"
 
-actions = data.actions
-services = data.services
-resource_types = data.resource_types
+DATA_ATTRIBUTES = {"actions", "services", "resource_types"}
+
+
+def __getattr__(name: str):
+    """Import the data module and its JSON lazily on first access."""
+    if name == "data" or name in DATA_ATTRIBUTES:
+        data = importlib.import_module(".data", __name__)
+        value = data if name == "data" else getattr(data, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
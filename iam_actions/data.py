@@ -1,19 +1,45 @@
 # SPDX-License-Identifier: MIT
 # Copyright 2020-2022 Big Bad Wolf Security, LLC
 
+import functools
 import json
+import pickle
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+FILENAMES = {
+    "services": "services.json",
+    "resource_types": "resourcetypes.json",
+    "actions": "actions.json",
+}
+
+
+@functools.cache
 def data(filename: str) -> dict:
+    path = Path(__file__).parent / filename
+    pickle_path = path.with_suffix(".pickle")
+    try:
+        # The generator writes a pickle beside each JSON file for speed,
+        # but one older than its JSON file is stale and left unused.
+        if pickle_path.stat().st_mtime >= path.stat().st_mtime:
+            with open(pickle_path, "rb") as fd:
+                return pickle.load(fd)
+    except FileNotFoundError:
+        pass
     try:
-        with open(Path(__file__).parent / filename, "r") as fd:
-            return json.load(fd)
+        with open(path, "rb") as fd:
+            return orjson.loads(fd.read()) if orjson else json.load(fd)
     except FileNotFoundError:
         print(f"{filename} not populated - please run iam_actions.generate")
         return None
 
 
-services = data("services.json")
-resource_types = data("resourcetypes.json")
-actions = data("actions.json")
+def __getattr__(name: str):
+    """Load each JSON file only when its attribute is first accessed."""
+    if name in FILENAMES:
+        return data(FILENAMES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -7,11 +7,15 @@ Calling `create_action_map` with a dict from the services module is the
 main entry point for this module.
 """
 
-from bs4 import Tag
+import re
 from dataclasses import dataclass, field
 from enum import Enum
 from loguru import logger
 
+# Resource names are whitespace-separated, with "*" marking required ones.
+RESOURCE_RE = re.compile(r"[^\s*]+")
+WHITESPACE_RE = re.compile(r"\s+")
+
 
 class AccessLevel(str, Enum):
     """Enumerate the possible action "AccessLevel" item values."""
@@ -33,40 +37,45 @@ class AccessLevel(str, Enum):
         return self.value
 
 
-@dataclass
+# Map documented access level strings to their enum members.
+ACCESS_LEVELS = {x.value: x for x in AccessLevel}
+
+
+@dataclass(slots=True, frozen=True)
 class ActionMap:
     """Define the structure of an AWS action definition."""
 
     access_level: AccessLevel = AccessLevel.NONE
     action: str = ""
-    condition_keys: list[str] = field(default_factory=list, repr=False)
+    condition_keys: tuple[str, ...] = field(default_factory=tuple, repr=False)
     description: str = ""
     orphan: bool = False
-    resources: list[str] = field(default_factory=list)
+    resources: tuple[str, ...] = field(default_factory=tuple)
 
 
-def process_actions_table(table: Tag) -> list[ActionMap]:
+def process_actions_table(table: list[list[str]]) -> list[ActionMap]:
     """Return a list of actions, one per row of the given table."""
     return [
         ActionMap(
             action=row[0].replace("[permission only]", "").strip(),
-            access_level=AccessLevel(row[2]),
-            resources=sorted({x.replace("*", "") for x in row[3].split()}),
-            condition_keys=sorted({x for x in row[4].split()}),
-            description=" ".join(row[1].split()),
+            access_level=ACCESS_LEVELS.get(row[2], AccessLevel.UNDOCUMENTED),
+            resources=tuple(sorted(set(RESOURCE_RE.findall(row[3])))),
+            condition_keys=tuple(sorted(set(row[4].split()))),
+            description=WHITESPACE_RE.sub(" ", row[1]).strip(),
         )
         for row in table
     ]
 
 
-def generate_action_map(docs: list[Tag], acts: list[str]) -> tuple[dict, list[str]]:
+def generate_action_map(docs: list, acts: list[str]) -> tuple[dict, list[str]]:
     """Return a tuple of service actions and any errors encountered.
 
     The given service name has its documentation URLs searched for
     action definitions.  They are then compared with the given known
     service action names to find undocumented actions.  The whole set of
     actions is then returned as a dict keyed on their names, alongside a
-    list of any error messages.
+    list of any error messages, which also name any actions documented
+    with an unknown access level.
     """
     actions = {}
     errors = []
@@ -77,15 +86,14 @@ def generate_action_map(docs: list[Tag], acts: list[str]) -> tuple[dict, list[st
         if not table:
             logger.info(f"Page missing actions table: {doc.readable_url()}")
             continue
-        for map in process_actions_table(table):
+        for row, map in zip(table, process_actions_table(table)):
             # Keep the first one as defined in the URL map.
-            if map.action not in actions:
-                actions[map.action] = map
+            if actions.setdefault(map.action, map) is map and row[2] not in ACCESS_LEVELS:
+                errors.append(f"Unknown access level found: {service}:{map.action} ({row[2]})")
 
     # Check if any known actions are missing from the documentation.
     boto_defined_actions = set(acts)
-    found_actions = set(actions.keys())
-    for action in boto_defined_actions - found_actions:
+    for action in boto_defined_actions.difference(actions):
         actions[action] = ActionMap(
             action=action,
             access_level=AccessLevel.UNDOCUMENTED,
@@ -1,19 +1,27 @@
 # SPDX-License-Identifier: MIT
 # Copyright 2020-2022 Big Bad Wolf Security, LLC
 
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from bs4 import Tag, BeautifulSoup
+from itertools import chain
+import functools
+import hashlib
 import json
-import urllib.request
+import lxml.html
+from lxml.html import HtmlElement
+from pathlib import Path
 from .action_map import generate_action_map
+from .cache import download, load_result, open_url, store_result
 from .resource_type import generate_resource_type
-from loguru import logger
 
 # Formerly: https://docs.aws.amazon.com/IAM/latest/UserGuide
 BASE_URL = "https://docs.aws.amazon.com/service-authorization/latest/reference"
 TABLE_URL_TEMPLATE = BASE_URL + "/list_{}.html"
 TOC_URL = BASE_URL + "/toc-contents.json"
 
+# The number of documentation pages downloaded concurrently.
+MAX_WORKERS = 16
+
 URL_MAP = {
     "a2c": ["awsapp2container"],
     "a2i-runtime.sagemaker": ["amazonsagemaker"],
@@ -400,38 +408,42 @@ URL_MAP = {
     "xray": ["awsx-ray"],
 }
 
+# Every documentation page name referenced by the URL map.
+URL_NAMES = frozenset(chain.from_iterable(URL_MAP.values()))
+
 
 @dataclass
 class AwsDocumentationPage:
     url: str
     service: str
-    soup: Tag = field(init=False)
-
-    ACTION_MAP_HEADERS = {
-        "actions",
-        "description",
-        "access level",
-        "resource types (*required)",
-        "condition keys",
-        "dependent actions",
-    }
-    RESOURCE_TYPE_HEADERS = {"Resource types", "ARN", "Condition keys"}
+    path: Path
+    tree: HtmlElement = field(init=False)
+
+    # Lowercase table headers, matched case-insensitively.
+    ACTION_MAP_HEADERS = frozenset(
+        {
+            "actions",
+            "description",
+            "access level",
+            "resource types (*required)",
+            "condition keys",
+            "dependent actions",
+        }
+    )
+    RESOURCE_TYPE_HEADERS = frozenset({"resource types", "arn", "condition keys"})
+
+    # The first table inside each div.table-contents, in one selector pass.
+    TABLE_XPATH = "//div[contains(concat(' ', normalize-space(@class), ' '), ' table-contents ')]/descendant::table[1]"
 
     def __post_init__(self):
-        self.fetch()
+        self.parse()
 
     def readable_url(self):
         return self.url.split("/list_", 1)[1]
 
-    def fetch(self):
-        with urllib.request.urlopen(self.url) as response:
-            page = response.read()
-            log_msg = f"Fetching {self.readable_url()} - {response.code}"
-            if response.code == 200:
-                logger.debug(log_msg)
-            else:
-                logger.error(log_msg)
-        self.soup = BeautifulSoup(page, "html.parser")
+    def parse(self):
+        # The cache keeps only the body, so the charset can't come from HTTP.
+        self.tree = lxml.html.parse(str(self.path), lxml.html.HTMLParser(encoding="utf-8")).getroot()
 
     def resource_type_table(self):
         return self.find_table_for_headers(self.RESOURCE_TYPE_HEADERS)
@@ -439,7 +451,7 @@ class AwsDocumentationPage:
     def action_map_table(self):
         return self.find_table_for_headers(self.ACTION_MAP_HEADERS)
 
-    def find_table_for_headers(self, expected_headers: list[str]) -> Tag | None:
+    def find_table_for_headers(self, expected_headers: frozenset[str]) -> HtmlElement | None:
         """Locate the actions table element in the web page.
 
         The table IDs seem to change, so search by div then look for the
@@ -457,10 +469,9 @@ class AwsDocumentationPage:
                             <th>Dependent Actions</th>
                         </tr>
         """
-        for div in self.soup.find_all("div", {"class": "table-contents"}):
-            table = div.find_all("table")[0]  # There should be only one.
-            headers = table.find_all("th")
-            if {x.lower() for x in expected_headers} == {x.string.lower() for x in headers}:
+        for table in self.tree.xpath(self.TABLE_XPATH):
+            headers = table.xpath(".//th")
+            if len(headers) == len(expected_headers) and expected_headers == frozenset(x.text_content().strip().lower() for x in headers):
                 return table
 
     def flat_action_map_table(self) -> list[list[str]] | None:
@@ -476,40 +487,54 @@ class AwsDocumentationPage:
         - The first row in a rowspan contains the required six cells.
         - If the first cell starts with SCENARIO, the AWS writer was drunk.
         """
-        if not self.action_map_table():
+        table = self.action_map_table()
+        if table is None:
             return None
 
         flat_table = []
 
-        rows = (x for x in self.action_map_table() if x.name == "tr")
-        for row in rows:
-            cells = [x for x in row if x.name == "td"]
+        rows = list(table.iterchildren("tr"))
+        index = 0
+        while index < len(rows):
+            cells = list(rows[index].iterchildren("td"))
             assert len(cells) == len(self.ACTION_MAP_HEADERS)
 
             # Process a row by converting its cells to a list of strings.
-            processed_row = [x.text.strip() for x in cells]
+            processed_row = [x.text_content().strip() for x in cells]
+
+            # Most rows span nothing, so they need no further processing.
+            if cells[0].get("rowspan", "1") == "1":
+                assert all(x.get("rowspan", "1") == "1" for x in cells)
+                flat_table.append(processed_row)
+                index += 1
+                continue
+
+            # Otherwise collect each column's text to join later.
+            parts = [[x] for x in processed_row]
             rowspans = [int(x.get("rowspan", "1")) for x in cells]
             max_rowspan = rowspans[0]
 
+            spanned_rows = rows[index + 1 : index + max_rowspan]
+            assert len(spanned_rows) == max_rowspan - 1 and max(rowspans) <= max_rowspan
+
             # Process any rows in a rowspan after the first.
-            for _ in range(1, max_rowspan):
-                row = next(rows)
-                cells = [x for x in row if x.name == "td"]
+            for offset, row in enumerate(spanned_rows, 1):
+                cells = list(row.iterchildren("td"))
 
                 # There are some weird rows that should be to ignored, e.g.
                 # ec2:RunInstance has a bunch of rows starting with "SCENARIO".
-                ignore_row = "SCENARIO" in cells[0].text
+                if "SCENARIO" in cells[0].text_content():
+                    continue
 
-                # Append each cell's text to the corresponding column.
-                cells = iter(cells)
-                for column in range(len(processed_row)):
-                    if rowspans[column] > 1:
-                        rowspans[column] -= 1
-                    elif not ignore_row:
-                        processed_row[column] += f" {next(cells).text.strip()}"
-            assert all(x == 1 for x in rowspans)
+                # Append each cell's text to the corresponding column, which
+                # are the columns whose own rowspan has already run out.
+                columns = [column for column, rowspan in enumerate(rowspans) if rowspan <= offset]
+                assert len(cells) >= len(columns)
+                for column, cell in zip(columns, cells):
+                    parts[column].append(cell.text_content().strip())
 
-            flat_table.append(processed_row)
+            flat_table.append([" ".join(x) for x in parts])
+            index += max_rowspan
 
         return flat_table
 
@@ -520,44 +545,105 @@ def missing_services(url: str = TOC_URL) -> set[str]:
     AWS posts a TOC JSON object with all their services.  Its service
     names are compared to the URL map to detect if any are missing.
     """
-    with urllib.request.urlopen(url) as response:
-        toc = json.loads(response.read())
+    with open_url(url) as response:
+        toc = json.load(response)
     toc_services = {service.get("href", "").removeprefix("list_").removesuffix(".html") for service in toc["contents"][0]["contents"][0]["contents"]}
-    return toc_services - set(sum(URL_MAP.values(), []))
+    return toc_services - URL_NAMES
 
 
-def fetch_docs_for_service(service: str) -> list[Tag]:
-    """Get a list of soup tags for a service"""
+def fetch_docs_for_service(executor: Executor, service: str) -> tuple[list[tuple[str, Future]], list[str]]:
+    """Start downloading the documentation pages for a service"""
     errors = []
     url_names = URL_MAP.get(service, [])
     if not url_names:
         errors.append(f"Service missing URL map: {service}")
-    # this will be a list of soup, since services could have multiple docpages
-    content = [AwsDocumentationPage(TABLE_URL_TEMPLATE.format(url), service) for url in url_names]
+    # this will be a list of pages, since services could have multiple docpages
+    urls = [TABLE_URL_TEMPLATE.format(url) for url in url_names]
+    content = [(url, executor.submit(download, url)) for url in urls]
     return (content, errors)
 
 
+@functools.cache
+def source_digest() -> bytes:
+    """Return a hash of this package's source code."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.read_bytes())
+    return digest.digest()
+
+
+def service_key(service: str, pages: list[tuple[str, Path]], actions: list[str]) -> str:
+    """Return a hash of everything that goes into processing a service.
+
+    That is the service's known actions and its downloaded pages, plus
+    this package's source so any change to the parsing code is noticed.
+    """
+    digest = hashlib.sha256(source_digest())
+    digest.update(f"{service}\0{sorted(actions)}".encode())
+    for url, path in pages:
+        digest.update(url.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def process_service(service: str, pages: list[tuple[str, Path]], actions: list[str]) -> tuple[dict, dict, list[str]]:
+    """Return the action map, resource types, and errors for a service.
+
+    This runs in a worker process, so it takes the paths of the
+    downloaded pages and only returns plain data and dataclasses.
+    """
+    errors = []
+    docs = [AwsDocumentationPage(url, service, path) for url, path in pages]
+
+    # Action Map
+    service_action_map, action_map_errors = generate_action_map(docs, actions)
+    errors.extend(action_map_errors)
+
+    # Resource Type
+    resource_type_map, resource_type_errors = generate_resource_type(docs)
+    errors.extend(resource_type_errors)
+
+    return (service_action_map, resource_type_map, errors)
+
+
 def fetch_docs_for_services(services: dict):
-    """Main entrypoint"""
+    """Main entrypoint
+
+    Downloading is almost entirely spent waiting on the network, so the
+    TOC and every page of every service are queued on a thread pool up
+    front.  Parsing is CPU bound, so each service is handed to a process
+    pool as soon as its pages have arrived.  Results are collected in
+    sorted service order, which keeps the output stable.
+    """
     errors = []
     action_map = {}
     resource_types = {}
-    for missing_svc in missing_services():
-        errors.append(f"Unmapped service is being published: {missing_svc}")
-
-    for service in sorted(services.keys()):
-        # Fetch
-        docs, fetch_errs = fetch_docs_for_service(service)
-        errors.extend(fetch_errs)
-
-        # Action Map
-        service_action_map, action_map_errors = generate_action_map(docs, services[service].Actions)
-        errors.extend(action_map_errors)
-        action_map[service] = service_action_map
-
-        # Resource Type
-        resource_type_map, resource_type_errors = generate_resource_type(docs)
-        errors.extend(resource_type_errors)
-        resource_types[service] = resource_type_map
+
+    names = sorted(services.keys())
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as threads, ProcessPoolExecutor() as processes:
+        toc = threads.submit(missing_services)
+        downloads = {service: fetch_docs_for_service(threads, service) for service in names}
+
+        keys = {}
+        results = {}
+        for service in names:
+            pages = [(url, x.result()) for url, x in downloads[service][0]]
+            # Reuse the previous result if nothing has changed for this service.
+            keys[service] = service_key(service, pages, services[service].Actions)
+            results[service] = load_result(service, keys[service]) or processes.submit(process_service, service, pages, services[service].Actions)
+
+        for missing_svc in toc.result():
+            errors.append(f"Unmapped service is being published: {missing_svc}")
+
+        for service in names:
+            result = results[service]
+            if isinstance(result, Future):
+                result = result.result()
+                store_result(service, keys[service], result)
+            service_action_map, resource_type_map, service_errors = result
+            errors.extend(downloads[service][1])
+            errors.extend(service_errors)
+            action_map[service] = service_action_map
+            resource_types[service] = resource_type_map
 
     return (action_map, resource_types, errors)
@@ -0,0 +1,139 @@
+# SPDX-License-Identifier: MIT
+# Copyright 2020-2023 Big Bad Wolf Security, LLC
+
+"""Fetch URLs through a persistent on-disk HTTP cache.
+
+Response bodies are stored under "$XDG_CACHE_HOME/iam_actions" along
+with their ETag and Last-Modified validators.  Entries younger than
+`MAX_AGE` seconds are reused as-is; older ones are revalidated with a
+conditional GET, so an unchanged page only costs a 304 response.
+
+Pages are always read back from the cache directory, which lets them
+be handed to other processes by path.  Pointing the cache at a
+temporary directory effectively disables it.
+
+Processed results can also be stored, one per name along with a key of
+their inputs, for work that only needs to be redone when those change.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from loguru import logger
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+__all__ = ["download", "load_result", "open_url", "set_cache_dir", "store_result"]
+
+# Cached responses are used without revalidation for this many seconds.
+MAX_AGE = 86400
+
+
+def default_cache_dir() -> Path:
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "iam_actions"
+
+
+cache_dir: Path = default_cache_dir()
+
+
+def set_cache_dir(path: Path) -> None:
+    """Set the directory that stores cached responses."""
+    global cache_dir
+    cache_dir = path
+
+
+def write_atomic(path: Path, source: BinaryIO) -> None:
+    """Copy a stream to a file so concurrent readers never see it half-written."""
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as fd:
+        shutil.copyfileobj(source, fd)
+    os.replace(fd.name, path)
+
+
+def log_response(url: str, code: int) -> None:
+    log_msg = f"Fetching {url} - {code}"
+    if code == 200:
+        logger.debug(log_msg)
+    else:
+        logger.error(log_msg)
+
+
+def download(url: str) -> Path:
+    """Return the path of an up-to-date cached copy of the given URL.
+
+    The body is requested gzipped and streamed straight into the cache,
+    decompressing on the way, so it is never held in memory whole.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    body_path = cache_dir / hashlib.sha256(url.encode()).hexdigest()
+    meta_path = body_path.with_suffix(".json")
+
+    request = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+    if body_path.exists() and meta_path.exists():
+        if time.time() - meta_path.stat().st_mtime < MAX_AGE:
+            logger.debug(f"Fetching {url} - cached")
+            return body_path
+        meta = json.loads(meta_path.read_text())
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            log_response(url, response.code)
+            if response.headers.get("Content-Encoding") == "gzip":
+                write_atomic(body_path, gzip.GzipFile(fileobj=response))
+            else:
+                write_atomic(body_path, response)
+            meta = {"url": url, "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+            write_atomic(meta_path, io.BytesIO(json.dumps(meta).encode()))
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        logger.debug(f"Fetching {url} - 304")
+        meta_path.touch()
+
+    return body_path
+
+
+@contextmanager
+def open_url(url: str) -> Iterator[BinaryIO]:
+    """Yield the body of the given URL as a binary stream from the cache."""
+    with open(download(url), "rb") as fd:
+        yield fd
+
+
+def result_path(name: str) -> Path:
+    return cache_dir / "results" / hashlib.sha256(name.encode()).hexdigest()
+
+
+def load_result(name: str, key: str):
+    """Return the result stored for a name if it is fresh and was made from
+    the given key, or None.  An expired result is deleted."""
+    path = result_path(name)
+    try:
+        if time.time() - path.stat().st_mtime >= MAX_AGE:
+            path.unlink()
+            return None
+        with open(path, "rb") as fd:
+            stored_key, result = pickle.load(fd)
+    except FileNotFoundError:
+        return None
+    return result if stored_key == key else None
+
+
+def store_result(name: str, key: str, result) -> None:
+    """Store a picklable result for a name, replacing the previous one, along
+    with the key of its inputs."""
+    path = result_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, io.BytesIO(pickle.dumps((key, result), protocol=5)))
@@ -11,23 +11,44 @@ with "python -m iam_actions.generate".  The CLI is described using the
 """
 
 import argparse
-import dataclasses
-import json
+import orjson
+import pickle
+import tempfile
+from . import cache
+from ..data import FILENAMES
 from .services import create_services, download_policy_definitions
 from .aws_docs import fetch_docs_for_services
 from pathlib import Path
+from typing import Optional
 
 __all__ = ["run"]
 
 
-class JSONEncoderDataclass(json.JSONEncoder):
-    """Define a JSON encoder that knows how to handle dataclasses."""
+def dump(obj, fd, indent: bool, pickle_path: Optional[Path] = None) -> None:
+    """Write an object as JSON; orjson handles dataclasses and enums natively.
 
-    def default(self, o):
-        """Return a presumed order-preserving dict for dataclasses."""
-        if dataclasses.is_dataclass(o):
-            return {f.name: getattr(o, f.name) for f in dataclasses.fields(o)}
-        return super().default(o)
+    With `pickle_path`, the same plain data is also written there as a
+    pickle, which iam_actions.data prefers as it loads faster.
+    """
+    json_bytes = orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    fd.write(json_bytes)
+    if pickle_path:
+        with open(pickle_path, "wb") as pickle_fd:
+            pickle.dump(orjson.loads(json_bytes), pickle_fd, protocol=5)
+
+
+def pickle_path(fd) -> Optional[Path]:
+    """Return the pickle path for an output file that iam_actions.data reads.
+
+    Only the bundled data files get a pickle; any other output, such as
+    a file elsewhere, a pipe or a standard stream, returns None.
+    """
+    if not isinstance(fd.name, str):
+        return None
+    path = Path(fd.name).resolve()
+    if path.parent != Path(default_directory()) or path.name not in FILENAMES.values():
+        return None
+    return path.with_suffix(".pickle")
 
 
 def default_directory() -> str:
@@ -44,7 +65,7 @@ def create_argument_parser() -> argparse.ArgumentParser:
         "--actions",
         metavar="PATH",
         help="Path to write the generated action map JSON",
-        type=argparse.FileType("w", encoding="UTF-8"),
+        type=argparse.FileType("wb"),
         default=f"{default_directory()}/actions.json",
     )
     parser.add_argument(
@@ -52,7 +73,7 @@ def create_argument_parser() -> argparse.ArgumentParser:
         "--services",
         metavar="PATH",
         help="Path to write the generated services JSON",
-        type=argparse.FileType("w", encoding="UTF-8"),
+        type=argparse.FileType("wb"),
         default=f"{default_directory()}/services.json",
     )
     parser.add_argument(
@@ -60,7 +81,7 @@ def create_argument_parser() -> argparse.ArgumentParser:
         "--resourcetypes",
         metavar="PATH",
         help="Path to write resource types JSON",
-        type=argparse.FileType("w", encoding="UTF-8"),
+        type=argparse.FileType("wb"),
         default=f"{default_directory()}/resourcetypes.json",
     )
     parser.add_argument(
@@ -68,12 +89,11 @@ def create_argument_parser() -> argparse.ArgumentParser:
         "--policies",
         metavar="PATH",
         help="Path to write Amazon's policies JSON (to debug)",
-        type=argparse.FileType("w", encoding="UTF-8"),
+        type=argparse.FileType("wb"),
         default=f"{default_directory()}/policies.json",
     )
-    parser.add_argument(
-        "-e", "--errors", metavar="PATH", help="Path to write errors and warnings JSON", type=argparse.FileType("w", encoding="UTF-8"), default=f"{default_directory()}/errors.json"
-    )
+    parser.add_argument("-e", "--errors", metavar="PATH", help="Path to write errors and warnings JSON", type=argparse.FileType("wb"), default=f"{default_directory()}/errors.json")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="Fetch every page from AWS instead of using the on-disk cache")
     parser.add_argument("-i", "--indent", default=True, action=argparse.BooleanOptionalAction, help="Pretty-print the JSON files", type=argparse.FileType("w", encoding="UTF-8"))
     return parser
 
@@ -81,22 +101,25 @@ def create_argument_parser() -> argparse.ArgumentParser:
 def run(*pargs, **kwargs) -> None:
     """This is the entry point function."""
     args = create_argument_parser().parse_args()
+    if not args.cache:
+        temporary_cache = tempfile.TemporaryDirectory(prefix="iam_actions-")
+        cache.set_cache_dir(Path(temporary_cache.name))
 
     policies = download_policy_definitions()
     if args.policies:
-        json.dump(policies, args.policies, cls=JSONEncoderDataclass, indent=1 if args.indent else None)
+        dump(policies, args.policies, args.indent)
 
     services = create_services(policies)
     if args.services:
-        json.dump(services, args.services, cls=JSONEncoderDataclass, indent=1 if args.indent else None)
+        dump(services, args.services, args.indent, pickle_path(args.services))
 
     actions, resource_types, errors = fetch_docs_for_services(services)
     if args.actions:
-        json.dump(actions, args.actions, cls=JSONEncoderDataclass, indent=1 if args.indent else None)
+        dump(actions, args.actions, args.indent, pickle_path(args.actions))
     if args.resourcetypes:
-        json.dump(resource_types, args.resourcetypes, cls=JSONEncoderDataclass, indent=1 if args.indent else None)
+        dump(resource_types, args.resourcetypes, args.indent, pickle_path(args.resourcetypes))
     if args.errors:
-        json.dump(errors, args.errors, cls=JSONEncoderDataclass, indent=1 if args.indent else None)
+        dump(errors, args.errors, args.indent)
 
 
 if __name__ == "__main__":
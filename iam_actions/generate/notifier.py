@@ -9,18 +9,35 @@ previous run.
 
 The environment variable S3_BUCKET defines the bucket that will store
 the uploaded files, and WEBHOOK optionally defines a Slack hook URL to
-send notifications.
+send notifications.  Besides reading and writing objects, the AWS
+credentials need s3:ListBucket on the bucket, as the current files are
+found by listing the "current/" prefix.
 """
 
 import argparse
-import boto3
+import base64
+import gzip
+import hashlib
+import importlib.util
+import io
 import json
 import os
-from datetime import datetime
-from slack_sdk.webhook import WebhookClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
+from threading import Thread
+from typing import Optional
 
-now = datetime.utcnow().isoformat()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+now = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+# S3 rejects a conditional write with 412 PreconditionFailed once another
+# write has landed, or 409 ConditionalRequestConflict while one is in flight.
+CONFLICT_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
 
 
 def default_directory() -> str:
@@ -38,7 +55,7 @@ def create_argument_parser() -> argparse.ArgumentParser:
         dest="action_map",
         metavar="PATH",
         help="Path to the actions JSON file to upload",
-        type=argparse.FileType("rb"),
+        type=Path,
         default=f"{default_directory()}/actions.json",
     )
     parser.add_argument(
@@ -46,7 +63,7 @@ def create_argument_parser() -> argparse.ArgumentParser:
         "--services",
         metavar="PATH",
         help="Path to the services JSON file to upload",
-        type=argparse.FileType("rb"),
+        type=Path,
         default=f"{default_directory()}/services.json",
     )
     parser.add_argument(
@@ -54,7 +71,7 @@ def create_argument_parser() -> argparse.ArgumentParser:
         "--resourcetypes",
         metavar="PATH",
         help="Path to the resource types JSON file to upload",
-        type=argparse.FileType("rb"),
+        type=Path,
         default=f"{default_directory()}/resourcetypes.json",
     )
     parser.add_argument(
@@ -62,45 +79,135 @@ def create_argument_parser() -> argparse.ArgumentParser:
         "--errors",
         metavar="PATH",
         help="Path to the errors JSON file to upload",
-        type=argparse.FileType("rb"),
+        type=Path,
         default=f"{default_directory()}/errors.json",
     )
     return parser
 
 
+def current_etags(client, bucket: str) -> dict:
+    """Return the ETags of the current files, keyed by name."""
+    etags = {}
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix="current/"):
+        for obj in page.get("Contents", []):
+            etags[obj["Key"].removeprefix("current/").removesuffix(".json")] = obj["ETag"]
+    return etags
+
+
+def upload_file(client, transfer_config, bucket: str, name: str, body: bytes, dest_path: str, latest_path: str, etags: dict) -> Optional[str]:
+    """Archive one JSON file at `dest_path` and update its copy at `latest_path`.
+
+    Nothing is uploaded if the file matches the current ETag, and the
+    current copy is left alone if it changes meanwhile.  Return a
+    message to report about the file, if any.
+    """
+    # A single-part upload's ETag is the MD5 of its body, which S3 also
+    # checks against the Content-MD5 header to reject corrupted uploads.
+    digest = hashlib.md5(body, usedforsecurity=False).digest()
+    new_hash = f'"{digest.hex()}"'
+
+    # An unchanged file is neither archived again nor replaced.
+    old_hash = etags.get(name)
+    if new_hash == old_hash:
+        return None
+
+    # The current copy is only replaced if it is still the one that was
+    # listed, so concurrent runs cannot overwrite each other.
+    condition = {"IfMatch": old_hash} if old_hash else {"IfNoneMatch": "*"}
+
+    # Archived copies are stored gzipped, while the current copy stays
+    # plain JSON for its readers, so both are uploaded side by side.  A
+    # large archive goes up in parts, each checked with a CRC32.
+    archived = io.BytesIO(gzip.compress(body, mtime=0))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        archive = executor.submit(
+            client.upload_fileobj,
+            archived,
+            bucket,
+            dest_path,
+            ExtraArgs={"ContentType": "application/gzip", "ChecksumAlgorithm": "CRC32"},
+            Config=transfer_config,
+        )
+        current = executor.submit(
+            client.put_object,
+            Bucket=bucket,
+            Key=latest_path,
+            Body=body,
+            ContentMD5=base64.b64encode(digest).decode(),
+            ContentType="application/json",
+            **condition,
+        )
+        archive.result()
+        try:
+            current.result()
+        except client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] not in CONFLICT_CODES:
+                raise
+            # Another run changed the current copy first, or is still
+            # writing it, in which case it may not exist yet.
+            try:
+                if client.head_object(Bucket=bucket, Key=latest_path)["ETag"] == new_hash:
+                    return None
+            except client.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] != "404":
+                    raise
+            return f"Skipped {latest_path}, which was changed by another run"
+
+    return f"Updated {latest_path}"
+
+
 def main(*pargs, **kwargs) -> None:
     """This is the entry point function."""
-    args = create_argument_parser().parse_args()
+    parser = create_argument_parser()
+    args = parser.parse_args()
     bucket = os.getenv("S3_BUCKET", None)
     webhook = os.getenv("SLACK_WEBHOOK", None)
 
+    # Each file is read once, then both parsed and uploaded from memory.
+    bodies = {}
+    for name, path in vars(args).items():
+        try:
+            bodies[name] = path.read_bytes()
+        except OSError as e:
+            parser.error(f"can't open '{path}': {e}")
+
     messages = [f"Scraping run completed {now}", ""]
-    if args.errors:
-        with args.errors as file:
-            errors = json.loads(file.read())
-        if errors:
-            messages += ["\r\n".join(["**Errors:**"] + [f"- {e}" for e in sorted(errors)])]
+    errors = orjson.loads(bodies["errors"]) if orjson else json.loads(bodies["errors"])
+    if errors:
+        messages.append("\r\n".join(["**Errors:**"] + [f"- {e}" for e in sorted(errors)]))
 
     if bucket:
-        client = boto3.client("s3")
+        # boto3 takes a while to import, so --help does not wait for it.
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        # boto3 clients are thread-safe, so the files share one whose
+        # pool keeps a warm connection for every worker.
+        config = Config(max_pool_connections=64, tcp_keepalive=True, retries={"mode": "adaptive", "max_attempts": 3})
+        client = boto3.client("s3", config=config)
+        # Only archives are uploaded as multipart, so the current copies
+        # keep the plain MD5 ETags they are compared by.
+        transfer_config = TransferConfig(multipart_threshold=8 << 20, multipart_chunksize=8 << 20, max_concurrency=10, use_threads=True)
         dest_dir = f"archived/{now}"
+        etags = current_etags(client, bucket)
 
-        for name, source in vars(args).items():
-            dest_path = f"{dest_dir}/{name}.json"
-            latest_path = f"current/{name}.json"
-
-            # Upload the file
-            client.upload_fileobj(source, bucket, dest_path)["ETag"]
-            # old_hash = client.head_object(Bucket=bucket, Key=latest_path)["ETag"]
-
-            # Update the file at the latest URL.
-            client.copy_object(Bucket=bucket, CopySource=f"{bucket}/{dest_path}", Key=latest_path)
+        jobs = [(name, body, f"{dest_dir}/{name}.json.gz", f"current/{name}.json") for name, body in bodies.items()]
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = {executor.submit(upload_file, client, transfer_config, bucket, *job, etags): job[0] for job in jobs}
+            results = {futures[x]: x.result() for x in as_completed(futures)}
+        messages.extend(results[name] for name in sorted(results) if results[name])
 
     if webhook:
-        print("\r\n\r\n".join(messages))
-        if WebhookClient and webhook:
-            slack = WebhookClient(webhook)
-            slack.send(text="\r\n\r\n".join(messages))
+        payload = "\r\n\r\n".join(messages)
+        print(payload)
+        if importlib.util.find_spec("slack_sdk"):
+            from slack_sdk.webhook import WebhookClient
+
+            # Delivery is best-effort, so a hung endpoint must not stall the run.
+            slack = Thread(target=WebhookClient(webhook, timeout=5).send, kwargs={"text": payload}, daemon=True)
+            slack.start()
+            slack.join(timeout=10)
 
 
 if __name__ == "__main__":
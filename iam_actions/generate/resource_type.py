@@ -3,7 +3,7 @@
 
 from dataclasses import dataclass
 from typing import Optional
-from bs4 import Tag
+from lxml.html import HtmlElement
 from loguru import logger
 
 
@@ -29,32 +29,32 @@ def resource_type_arn_to_globs(arn):
     return "".join(out)
 
 
-def process_resource_type_table(table: list[list[str]]) -> dict[str, dict[str, str]]:
-    if not table:
+def process_resource_type_table(table: HtmlElement | None) -> dict[str, dict[str, str]]:
+    if table is None:
         return None
     rts = {}
-    rows = [x for x in table.contents if x.name == "tr"]
-    for row in rows:
-        cells = [x for x in row.contents if x.name == "td"]
+    for row in table.iterchildren("tr"):
+        cells = list(row.iterchildren("td"))
         if len(cells) == 0:
             continue
 
         rt = ResouceTypeDetail()
-        rt.resource_type_name = str(cells[0].text.strip())
+        rt.resource_type_name = cells[0].text_content().strip()
 
         assert rt.resource_type_name is not None
 
-        rt.arn_pattern = resource_type_arn_to_globs("".join([str(x.string) for x in cells[1].code.contents]))
+        rt.arn_pattern = resource_type_arn_to_globs(cells[1].find(".//code").text_content())
 
-        if cells[2].a is not None:
-            rt.condition_keys = str(cells[2].a.string)
+        condition_key = cells[2].find(".//a")
+        if condition_key is not None:
+            rt.condition_keys = condition_key.text_content()
 
         rts[rt.resource_type_name] = {"arn_pattern": rt.arn_pattern, "condition_keys": rt.condition_keys}
 
     return rts
 
 
-def generate_resource_type(docs: list[Tag]):
+def generate_resource_type(docs: list):
     rts = {}
     errors = []
     for doc in docs:
@@ -1,8 +1,8 @@
 # SPDX-License-Identifier: MIT
 # Copyright 2020-2023 Big Bad Wolf Security, LLC
 
-import json
-import urllib.request
+import orjson
+from .cache import open_url
 from dataclasses import dataclass, field
 
 __all__ = ["create_services", "download_policy_definitions"]
@@ -31,9 +31,9 @@ class Service:
 
 def download_policy_definitions(url: str = POLICIES_URL) -> dict:
     """Return Amazon's policy definitions as a parsed JSON object."""
-    with urllib.request.urlopen(url) as response:
+    with open_url(url) as response:
         json_string = response.read().removeprefix(b"app.PolicyEditorConfig=")
-    return json.loads(json_string)
+    return orjson.loads(json_string)
 
 
 def create_services(policies: dict) -> dict[str, Service]: